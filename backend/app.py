@@ -1,7 +1,8 @@
 import random
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, JSON, Boolean
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from pydantic import BaseModel, EmailStr
@@ -14,6 +15,7 @@ from scipy.sparse import hstack
 import pandas as pd
 import json
 import hashlib
+import threading
 from langchain import HuggingFacePipeline
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 import torch
@@ -135,6 +137,13 @@ class SurveyResponse(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     recommendation_made = Column(String)
 
+class ModelVersion(Base):
+    """Single-row record of the catalog version shared by all workers"""
+    __tablename__ = "model_versions"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 # Pydantic Models
 class GiftBase(BaseModel):
     name: str
@@ -149,6 +158,7 @@ class GiftCreate(GiftBase):
 class GiftResponse(GiftBase):
     id: int
     score: Optional[float] = None
+    model_version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -170,6 +180,7 @@ class GiftRecommender:
         self.encoder = OneHotEncoder(sparse_output=True, handle_unknown='ignore')
         self.nn_model = NearestNeighbors(n_neighbors=10, metric='cosine')
         self.is_fitted = False
+        self.version = None
 
     def _extract_features(self, gift):
         """Extract features from a gift object"""
@@ -347,31 +358,114 @@ SAMPLE_GIFTS = [
     }
 ]
 
-# Initialize recommender
-recommender = GiftRecommender()
-
 # Database initialization
+MODEL_VERSION_ID = 1
+MODEL_POLL_INTERVAL = 2.0  # seconds between checks of the shared model version
+
+def get_model_version(db: Session) -> int:
+    """Read the current catalog version from the shared record"""
+    record = db.query(ModelVersion).filter(ModelVersion.id == MODEL_VERSION_ID).first()
+    return record.version if record else 0
+
+def bump_model_version(db: Session):
+    """Increment the catalog version; commit together with the catalog write"""
+    db.query(ModelVersion).filter(ModelVersion.id == MODEL_VERSION_ID).update(
+        {ModelVersion.version: ModelVersion.version + 1, ModelVersion.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
 
 def init_db():
     Base.metadata.create_all(bind=engine)
     
     db = SessionLocal()
+    if not db.query(ModelVersion).filter(ModelVersion.id == MODEL_VERSION_ID).first():
+        try:
+            db.add(ModelVersion(id=MODEL_VERSION_ID, version=0))
+            db.commit()
+        except IntegrityError:
+            # Another worker created the record first
+            db.rollback()
+
     existing_gifts = db.query(Gift).first()
     
     if not existing_gifts:
         for gift_data in SAMPLE_GIFTS:
             gift = Gift(**gift_data)
             db.add(gift)
+        bump_model_version(db)
         db.commit()
-        
-        gifts = db.query(Gift).all()
-        recommender.fit(gifts)
     
     db.close()
 
+# Recommender synchronization across workers
+class RecommenderSync:
+    """Keeps this worker's recommender in step with the shared model version.
+
+    A background thread polls the version record and, when it changes, fits a
+    fresh GiftRecommender off the request path and swaps it in with a single
+    reference assignment. Requests always read one consistent model.
+    """
+    def __init__(self, poll_interval: float = MODEL_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.recommender = GiftRecommender()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Rebuild the recommender if the shared version has moved"""
+        with self._refresh_lock:
+            db = SessionLocal()
+            try:
+                # Read the version before the catalog so a model is never
+                # labelled newer than the data it was fitted on
+                version = get_model_version(db)
+                if version == self.recommender.version:
+                    return
+                gifts = db.query(Gift).all()
+            finally:
+                db.close()
+
+            new_recommender = GiftRecommender()
+            new_recommender.fit(gifts)
+            new_recommender.version = version
+            self.recommender = new_recommender
+            print(f"Recommender updated to model version {version}")
+
+    def notify(self):
+        """Ask the background thread to check for a new version now"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing recommender: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="recommender-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval)
+
 # Initialize database
 init_db()
 
+# Initialize recommender
+recommender_sync = RecommenderSync()
+recommender_sync.refresh()
+
 # FastAPI app initialization
 app = FastAPI(title="Gift Recommendation API")
 
@@ -384,6 +478,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def start_recommender_sync():
+    recommender_sync.start()
+
+@app.on_event("shutdown")
+def stop_recommender_sync():
+    recommender_sync.stop()
+
 # Database dependency
 def get_db():
     db = SessionLocal()
@@ -417,18 +519,14 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
     
     return {"email": db_user.email, "has_completed_survey": db_user.has_completed_survey}
 @app.post("/survey", response_model=List[GiftResponse])
-async def submit_survey(survey: SurveyRequest, db: Session = Depends(get_db)):
+async def submit_survey(survey: SurveyRequest, response: Response, db: Session = Depends(get_db)):
     try:
         # Log the incoming survey data
         print("Received survey responses:", survey.responses)
         
-        # Get all gifts and log the count
-        gifts = db.query(Gift).all()
-        print(f"Found {len(gifts)} gifts in database")
-        
-        if not recommender.is_fitted:
-            print("Fitting recommender with gifts")
-            recommender.fit(gifts)
+        # Take one reference so the whole request uses a single model
+        recommender = recommender_sync.recommender
+        print(f"Serving from model version {recommender.version}")
         
         # Get recommendations with error handling
         try:
@@ -451,7 +549,8 @@ async def submit_survey(survey: SurveyRequest, db: Session = Depends(get_db)):
         db.add(survey_response)
         db.commit()
         
-        return [GiftResponse(**rec) for rec in recommendations[:3]]
+        response.headers["X-Model-Version"] = str(recommender.version)
+        return [GiftResponse(**rec, model_version=recommender.version) for rec in recommendations[:3]]
         
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
@@ -473,12 +572,12 @@ def create_gift(gift: GiftCreate, db: Session = Depends(get_db)):
     try:
         db_gift = Gift(**gift.dict())
         db.add(db_gift)
+        bump_model_version(db)
         db.commit()
         db.refresh(db_gift)
         
-        # Update recommender with new gift data
-        gifts = db.query(Gift).all()
-        recommender.fit(gifts)
+        # Other workers pick up the new version on their next poll
+        recommender_sync.notify()
         
         return db_gift
     except Exception as e: